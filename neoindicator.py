@@ -4,13 +4,18 @@
 # Neo Indicator
 #
 # Urs Utzinger, Spring 2023
+#
+# Frames are rendered with integer arithmetic and lookup tables
+# (color wheel, blob ramps, hum levels) computed at start up,
+# there is no trigonometry or other float math per pixel.
 ###########################################################
 
 # IMPORTS
 ################################################################
-import math
+import numpy as np
 import board
 import neopixel
+from neopixel_write import neopixel_write
 import asyncio
 import logging
 import zmq
@@ -20,10 +25,12 @@ import os
 import signal
 import msgpack
 import time
+import math
+from dataclasses import dataclass, fields
+from enum import IntEnum
 
 if os.name != 'nt':
     import uvloop
-    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 ###########################################################
 # Configs for NEOPIXEL strip(s)
@@ -50,58 +57,99 @@ DISTANCE_PIXEL = 0.025      # distance between the individual pixels on the stri
 BLOBWIDTH      = 6          # number of pixels for a running light blob 
 MAXSPEED       = 15         # m/s 15*3600/1000 km/h, when you reach this speed, color will be 
                             # on max side of the rainbow spectrum
+SPEEDEPS       = 0.01       # m/s, speed changes smaller than this do not update the speed display
+
+HUMINTENFRAC   = 0.3        # fraction of light (linear) the humming drops by
+HUMINTERVAL    = 3.0        # sec, time to ramp from low to high intensity
+HUMSTEPS       = 20         # intensity steps per ramp
 
-HUMINTENFRAC   = 0.3
-HUMINTERVAL    = 3.0 # sec
+GAMMA          = 2.2        # pixel values are sRGB like encoded, fades are computed in linear light
 
 ###########################################################
 # Constants
 ###########################################################
 
-TWOPI   = 2.0 * math.pi
-PIHALF  = math.pi / 2.0
-DEG2RAD = math.pi / 180.0
-RAD2DEG = 180.0 / math.pi
-EPSILON = 2.0*math.ldexp(1.0, -53)
+# The shadow buffer holds the pixels in the strip's channel order.
+# Colors and tables are written as RGBW and permuted once here,
+# frames go to the strip without reordering.
+WIRE_ORDER = ["RGBW".index(channel) for channel in ORDER]
 
 # COLORS
-WHT = (255, 255, 255,   0)  # color to  turn on to
-RED = (255,   0,   0,   0)  # RED
-GRN = (  0, 255,   0,   0)  # GREEN
-BLU = (  0,   0, 255,   0)  # BLUE
-BLK = (  0,   0,   0,   0)  # CLEAR
+WHT = np.array((255, 255, 255,   0), dtype=np.uint8)[WIRE_ORDER]  # color to  turn on to
+RED = np.array((255,   0,   0,   0), dtype=np.uint8)[WIRE_ORDER]  # RED
+GRN = np.array((  0, 255,   0,   0), dtype=np.uint8)[WIRE_ORDER]  # GREEN
+BLU = np.array((  0,   0, 255,   0), dtype=np.uint8)[WIRE_ORDER]  # BLUE
+BLK = np.array((  0,   0,   0,   0), dtype=np.uint8)[WIRE_ORDER]  # CLEAR
+
+# Color wheel for all 256 positions, animations look up whole arrays of positions
+# RED, GREEN, BLUE, WHITE
+# min red to green, medium green to blue, max blue to red
+_pos   = np.arange(256)
+_red   = np.where(_pos < 85, 255 - _pos*3, np.where(_pos < 170, 0,                  (_pos-170)*3))
+_green = np.where(_pos < 85, _pos*3,       np.where(_pos < 170, 255 - (_pos-85)*3,  0))
+_blue  = np.where(_pos < 85, 0,            np.where(_pos < 170, (_pos-85)*3,        255 - (_pos-170)*3))
+_COLORWHEEL_RGBW = np.stack((_red, _green, _blue, np.zeros_like(_pos)), axis=1).astype(np.uint8)
+COLORWHEEL_LUT   = _COLORWHEEL_RGBW[:, WIRE_ORDER]
+del _pos, _red, _green, _blue
+_SPEED2IDX       = 255. / MAXSPEED # color wheel position per m/s
 
-def obj2dict(obj):
+def colorwheel(pos):
+    if pos < 0 or pos > 255: return (0, 0, 0, 0) # out of range: off
+    return tuple(int(channel) for channel in _COLORWHEEL_RGBW[pos])
+
+# Fades are defined in linear light and encoded back to pixel values once.
+# Light of a pixel grows with its value to the power of GAMMA, scaling the
+# pixel values linearly (or with the former inten**3) does not fade the light linearly.
+
+# Light of the pixels in a speed blob as fraction of the full color (linear),
+# tail to head when moving forward and head to tail when moving backward
+BLOB_RAMP_UP   = np.array([     k/BLOBWIDTH  for k in range(BLOBWIDTH)])
+BLOB_RAMP_DOWN = np.array([(1.-k/BLOBWIDTH) for k in range(BLOBWIDTH)])
+# Pixel value scale giving the ramp's light, (fraction of light)**(1/GAMMA),
+# kept as 8 bit fixed point for integer math
+BLOB_SCALE_UP   = (BLOB_RAMP_UP  **(1./GAMMA) * 256).astype(np.uint16)
+BLOB_SCALE_DOWN = (BLOB_RAMP_DOWN**(1./GAMMA) * 256).astype(np.uint16)
+
+# White level of humming light, one ramp up followed by one ramp down
+_hum_up    = [255. * ((1. - HUMINTENFRAC) + HUMINTENFRAC*k/HUMSTEPS)**(1./GAMMA) for k in range(HUMSTEPS+1)]
+HUM_LEVELS = tuple(int(level) for level in _hum_up + _hum_up[-2:0:-1])
+del _hum_up
+HUM_COLORS = (np.array(HUM_LEVELS)[:, None] * np.array((1, 1, 1, 0))[WIRE_ORDER]).astype(np.uint8) # white channel stays off
+
+def blob_windows(start: int, end: int):
     '''
-    encoding object variables to nested dict
-    ''' 
-    if isinstance(obj, dict):
-        return {k: obj2dict(v) for k, v in obj.items()}
-    elif hasattr(obj, '__dict__'):
-        return obj2dict(vars(obj))
-    elif isinstance(obj, list):
-        return [obj2dict(item) for item in obj]
-    else:
-        return obj
-
-
-class dict2obj:
+    pixel indices covered by a blob for every head position on a strip,
+    blobs wrap around at the end of the strip
+    returns forward and backward tables shaped (strip length, BLOBWIDTH)
     '''
-    decoding nested dictionary to object
+    length   = end - start + 1
+    heads    = np.arange(length)[:, None]
+    offsets  = np.arange(BLOBWIDTH)[None, :]
+    forward  = start + (heads - BLOBWIDTH + 1 + offsets) % length   # trails behind its head
+    backward = start + (heads + offsets) % length
+    return forward, backward
+
+def blob_colors(color, forward: bool = True):
     '''
-    def __init__(self, data):
-        for key, value in data.items():
-            if isinstance(value, dict):
-                setattr(self, key, dict2obj(value))
-            else:
-                setattr(self, key, value)
+    scale color pixel values with the encoded blob ramp, one row per blob pixel
+    '''
+    scale = BLOB_SCALE_UP if forward else BLOB_SCALE_DOWN
+    return ((np.asarray(color, dtype=np.uint16)[None, :] * scale[:, None]) >> 8).astype(np.uint8)
 
-def colorwheel(pos):
-    # RED, GREEN, BLUE, ?
-    if pos < 0 or pos > 255: return (0, 0, 0, 0)                                     # out of range: off
-    if pos < 85:             return (255 - pos * 3,       pos * 3,             0, 0) # min    red to green
-    if pos < 170: pos -= 85; return (            0, 255 - pos * 3,       pos * 3, 0) # medium green to blue
-    pos -= 170;              return (      pos * 3,             0, 255 - pos * 3, 0) # max    blue to white
+class framePacer:
+    '''
+    Paces animation frames on a fixed time grid,
+    time spent rendering a frame does not stretch the interval.
+    When more than one frame behind, frames are dropped instead of rushed.
+    '''
+    def __init__(self):
+        self.next_frame = time.monotonic_ns()
+
+    async def wait(self, interval_ns: int):
+        now = time.monotonic_ns()
+        self.next_frame += interval_ns
+        if self.next_frame < now - interval_ns: self.next_frame = now
+        await asyncio.sleep(max(0, self.next_frame - now) / 1e9)
 
 # We have following static and dynamic pixel displays
 # Speed: a blob of light runs along the strip at the indicated speed, color changes with speed
@@ -111,26 +159,46 @@ def colorwheel(pos):
 # On: all pixels are on
 # Hum: white light intensity on all pixels fluctuates
 # Stop: exit program
-neoshow = {"speed": 1, "battery": 2, "rainbow": 3, "stop": 4, "off": 5 , "on": 6, 'hum':7, 'brightness':8}
-
-class neoData(object):
+# Brightness: change brightness of all displays
+class neoShow(IntEnum):
+    SPEED      = 1
+    BATTERY    = 2
+    RAINBOW    = 3
+    STOP       = 4
+    OFF        = 5
+    ON         = 6
+    HUM        = 7
+    BRIGHTNESS = 8
+
+@dataclass(slots=True)
+class neoData:
     '''
     Neopixel data
     Sent/Received via ZMQ to control light display
+    Packed with msgpack as tuple in field order, see dataclasses.astuple
     '''
-    def __init__(self,
-                 show: int = neoshow["off"],
-                 speed_left: float = 0.0,
-                 speed_right: float = 0.0,
-                 battery_left: float = 0.0,
-                 battery_right: float = 0.0,
-                 intensity: float = BRIGHTNESS) -> None:
-        self.show          = show                   # Show indicator
-        self.speed_left    = speed_left             # Speed on left wheel
-        self.speed_right   = speed_right            # Speed on right wheel
-        self.battery_left  = battery_left           # Battery indicator for main battery
-        self.battery_right = battery_right          # Battery indicator for remote battery
-        self.intensity     = intensity / 100.
+    show:          int   = neoShow.OFF         # Show indicator
+    speed_left:    float = 0.0                 # Speed on left wheel
+    speed_right:   float = 0.0                 # Speed on right wheel
+    battery_left:  float = 0.0                 # Battery indicator for main battery
+    battery_right: float = 0.0                 # Battery indicator for remote battery
+    intensity:     float = BRIGHTNESS / 100.   # Brightness between 0.0 and 1.0
+
+    @classmethod
+    def unpack(cls, msg_packed: bytes):
+        '''
+        Decode a msgpack tuple in field order
+        Raises ValueError when the payload does not match the fields or a level is not finite
+        '''
+        values = msgpack.unpackb(msg_packed, use_list=False)
+        if not isinstance(values, tuple) or len(values) != len(fields(cls)):
+            raise ValueError('neoData expects a tuple of {} fields'.format(len(fields(cls))))
+        show, *levels = values
+        if type(show) is not int or not all(type(level) in (int, float) for level in levels):
+            raise ValueError('neoData show must be int and levels numeric')
+        if not all(math.isfinite(level) for level in levels):
+            raise ValueError('neoData levels must be finite')
+        return cls(*values)
 
 class NeoIndicator:
     '''
@@ -147,238 +215,313 @@ class NeoIndicator:
 
     def __init__(self, logger=None):
         self.intensity = BRIGHTNESS/100.
-        self.pixels = neopixel.NeoPixel(PIXEL_PIN, NUMPIXELS, brightness=BRIGHTNESS/100., auto_write=False, pixel_order=ORDER)
+        self._scale = ((np.arange(256) * int(self.intensity * 256)) >> 8).astype(np.uint8)
+        self.pixels = neopixel.NeoPixel(PIXEL_PIN, NUMPIXELS, brightness=1.0, auto_write=False, pixel_order=ORDER)
         self.logger = logger
+        # frames are composed in this shadow buffer in the strip's channel order,
+        # scaled by intensity and written to the pin as raw bytes.
+        # This bypasses the per pixel conversion and brightness scaling of the NeoPixel driver.
+        self._buf = np.zeros((NUMPIXELS, len(WIRE_ORDER)), dtype=np.uint8)
+        self._raw = bytearray(self._buf.nbytes)
+        # the writer task sends frames to the strip in a worker thread,
+        # frames composed during a transfer replace each other, only the newest is written
+        self._last        = None # last frame handed to the writer
+        self._pending     = None # frame waiting for the writer
+        self._frame_ready = asyncio.Event()
+        self._closing     = False
+        # one animate() task renders the active animation, static displays set mode to None
+        self.mode = None
+        self._animating = asyncio.Event()
+        self._frames = {
+            neoShow.RAINBOW: self._rainbow_frame,
+            neoShow.HUM:     self._hum_frame,
+            neoShow.SPEED:   self._speed_frame,
+        }
+        self.speed_left     = 0.
+        self.speed_right    = 0.
+        self._speed_pending = False # new speeds waiting for the next speed frame
 
-    def brightness(self, brightness=BRIGHTNESS/100.):
+        LEFT_LENGTH  = END_LEFT  - START_LEFT  +1
+        RIGHT_LENGTH = END_RIGHT - START_RIGHT +1
+        # rainbow: position along the strip does not change, only the color offset does
+        # right strip runs backwards, its base index counts down from END_RIGHT
+        strip_pixels = np.concatenate((np.arange(START_LEFT, END_LEFT+1), np.arange(START_RIGHT, END_RIGHT+1)))
+        base         = np.concatenate(((np.arange(LEFT_LENGTH)  * 256) // LEFT_LENGTH,
+                                      ((np.arange(RIGHT_LENGTH) * 256) // RIGHT_LENGTH)[::-1]))
+        # the color offset takes only 256 values, render all frames once (256*NUMPIXELS*channels bytes)
+        self._rainbow_frames = np.zeros((256,) + self._buf.shape, dtype=np.uint8)
+        self._rainbow_frames[:, strip_pixels] = COLORWHEEL_LUT[(base[None, :] + np.arange(256)[:, None] * 5) & 255]
+        self._rainbow_color    = 0
+        self._rainbow_interval = int(INTERVAL * 1e9)
+
+        self._hum_level    = 0
+        self._hum_interval = int(HUMINTERVAL / HUMSTEPS * 1e9)
+
+        # speed: strip geometry is fixed, look up the blob pixels for each head position
+        self._left_windows  = blob_windows(START_LEFT,  END_LEFT)
+        self._right_windows = blob_windows(START_RIGHT, END_RIGHT)
+        self._lit_left      = self._left_windows[0][0, :0]  # pixels lit in previous frame
+        self._lit_right     = self._right_windows[0][0, :0]
+
+    def set_brightness(self, brightness=BRIGHTNESS/100.):
+        # brightness is applied when the frame is written, no need to touch the driver
         self.intensity = brightness
-        self.pixels = neopixel.NeoPixel(PIXEL_PIN, NUMPIXELS, brightness=self.intensity, auto_write=False, pixel_order=ORDER)
-            
+        # pixel value to scaled pixel value, one lookup per byte when writing
+        self._scale = ((np.arange(256) * int(brightness * 256)) >> 8).astype(np.uint8)
+        self._flush()
+
+    def _flush(self):
+        frame = self._scale[self._buf].tobytes()
+        if frame == self._last: return # strip already displays or is about to display this frame
+        self._last    = frame
+        self._pending = frame
+        self._frame_ready.set()
+
+    def _write(self, frame):
+        # runs in a worker thread, the raw buffer keeps its identity so the driver is not re-initialized
+        self._raw[:] = frame
+        neopixel_write(self.pixels.pin, self._raw)
+
+    async def writer(self):
+        '''
+        Writes the newest frame to the strip without blocking the event loop.
+        Ends after close() once the last frame is written.
+        '''
+        loop  = asyncio.get_running_loop()
+        ready = self._frame_ready
+        while not (self._closing and self._pending is None):
+            await ready.wait()
+            ready.clear()
+            frame, self._pending = self._pending, None
+            if frame is None: continue
+            try:
+                await loop.run_in_executor(None, self._write, frame)
+            except Exception:
+                # a failed transfer loses this frame, not the writer
+                if self.logger is not None:
+                    self.logger.exception('Neopixel strip write failed')
+                if self._last is frame: self._last = None # same frame is written again when flushed
+
+    def close(self):
+        # let the writer finish the pending frame and end
+        self._closing = True
+        self._frame_ready.set()
+
     def clear(self):
-        self.pixels.fill(BLK)
-        self.pixels.show()
+        self.mode = None
+        self._buf[:] = BLK
+        self._flush()
 
     def white(self):
-        self.pixels.fill(WHT)
-        self.pixels.show()
+        self.mode = None
+        self._buf[:] = WHT
+        self._flush()
 
     def battery(self, level_left:float=0.8, level_right:float=0.5):
+        self.mode = None
         END_GREEN_LEFT  = START_LEFT +int((END_LEFT-START_LEFT+1)*level_left)
         END_GREEN_RIGHT = START_RIGHT+int((END_RIGHT-START_RIGHT+1)*(1.-level_right))
-        for pixel in range(0,                 START_LEFT):        self.pixels[pixel] = BLK
-        for pixel in range(END_LEFT+1,        START_RIGHT):       self.pixels[pixel] = BLK
-        for pixel in range(END_RIGHT+1,       NUMPIXELS):         self.pixels[pixel] = BLK
-        for pixel in range(START_LEFT,        END_GREEN_LEFT+1):  self.pixels[pixel] = RED
-        for pixel in range(END_GREEN_LEFT+1,  END_LEFT+1):        self.pixels[pixel] = GRN
-        for pixel in range(END_GREEN_RIGHT+1, END_RIGHT+1):       self.pixels[pixel] = RED
-        for pixel in range(START_RIGHT,       END_GREEN_RIGHT+1): self.pixels[pixel] = GRN
-        self.pixels.show()
-
-    async def rainbow_start(self, stop_event: asyncio.Event):
-        LEFT_LENGTH  = END_LEFT  - START_LEFT  +1
-        RIGHT_LENGTH = END_RIGHT - START_RIGHT +1
-        left_list  = list(range(START_LEFT, END_LEFT + 1, 1))
-        right_list = list(range(END_RIGHT, START_RIGHT - 1, -1))
-        color = 0
-
-        while not stop_event.is_set():
-            color += 1
-            if color > 255: color = 0
-            for pixel in left_list:
-                color_index = ((pixel-START_LEFT) * 256 // LEFT_LENGTH) + color * 5
-                self.pixels[pixel] = colorwheel(color_index & 255)
-            for pixel in right_list:
-                color_index = ((END_RIGHT-pixel) * 256 // RIGHT_LENGTH) + color * 5
-                self.pixels[pixel] = colorwheel(color_index & 255)
-            self.pixels.show()
-            await asyncio.sleep(INTERVAL)
-
-        self.clear()
-
-    async def hum_start(self, stop_event: asyncio.Event):
-        left_list  = list(range(START_LEFT, END_LEFT + 1, 1))
-        right_list = list(range(END_RIGHT, START_RIGHT - 1, -1))
-        HUMINTENEND   = self.intensity
-        HUMINTENSTART = self.intensity * (1. - HUMINTENFRAC)
-        HUMINTENINC   = (HUMINTENEND - HUMINTENSTART) / 20.
-        INTENSITY     = self.intensity
-        INTERVAL      = HUMINTERVAL / 20.
-        while not stop_event.is_set():
-            HUMINTENEND   = self.intensity
-            HUMINTENSTART = self.intensity * (1. - HUMINTENFRAC)
-            HUMINTENINC   = (HUMINTENEND - HUMINTENSTART) / 20.
-            INTENSITY += HUMINTENINC
-            if (INTENSITY > HUMINTENEND) or (INTENSITY < HUMINTENSTART):
-                INTENSITYINC = -INTENSITYINC
-            else:
-                for pixel in left_list:
-                    self.pixels[pixel] = ( INTENSITY, INTENSITY, INTENSITY, 0 )
-                for pixel in right_list:
-                    self.pixels[pixel] = ( INTENSITY, INTENSITY, INTENSITY, 0 )
-                self.pixels.show()
-            await asyncio.sleep(INTERVAL)
-        # no more humming
-        self.white()
+        buf = self._buf
+        buf[0                :START_LEFT]        = BLK
+        buf[END_LEFT+1       :START_RIGHT]       = BLK
+        buf[END_RIGHT+1      :NUMPIXELS]         = BLK
+        buf[START_LEFT       :END_GREEN_LEFT+1]  = RED
+        buf[END_GREEN_LEFT+1 :END_LEFT+1]        = GRN
+        buf[END_GREEN_RIGHT+1:END_RIGHT+1]       = RED
+        buf[START_RIGHT      :END_GREEN_RIGHT+1] = GRN
+        self._flush()
+
+    def _start(self, mode):
+        # hand the strip to the animate() task
+        self.mode = mode
+        self._animating.set()
+
+    async def animate(self, stop_event: asyncio.Event):
+        '''
+        Renders the active animation, one frame per tick.
+        Sleeps until an animation is started while a static display is shown.
+        '''
+        frames  = self._frames
+        stopped = stop_event.is_set
+        pacer   = framePacer()
+        while not stopped():
+            frame = frames.get(self.mode)
+            if frame is None:
+                self._animating.clear()
+                await self._animating.wait()
+                pacer = framePacer() # restart the frame grid after idling
+                continue
+            try:
+                interval = frame()
+            except Exception:
+                # a broken frame ends its animation, not the animate task
+                if self.logger is not None:
+                    self.logger.exception('Neopixel {} animation failed'.format(self.mode.name))
+                self.mode = None
+                continue
+            await pacer.wait(interval)
+
+    def rainbow_start(self):
+        self._rainbow_color = 0
+        self._start(neoShow.RAINBOW)
+
+    def _rainbow_frame(self):
+        self._rainbow_color = (self._rainbow_color + 1) & 255
+        self._buf[:] = self._rainbow_frames[self._rainbow_color]
+        self._flush()
+        return self._rainbow_interval
+
+    def hum_start(self):
+        self._buf[:] = BLK
+        self._hum_level = 0
+        self._start(neoShow.HUM)
+
+    def _hum_frame(self):
+        level = self._hum_level
+        self._buf[START_LEFT :END_LEFT+1]  = HUM_COLORS[level]
+        self._buf[START_RIGHT:END_RIGHT+1] = HUM_COLORS[level]
+        self._flush()
+        level += 1
+        self._hum_level = level if level < len(HUM_LEVELS) else 0
+        return self._hum_interval
+
+    def _compute_interval(self, speed_left:float, speed_right:float):
+        # frame interval short enough for the faster blob to move smoothly, not longer than INTERVAL
+        total = abs(speed_left) + abs(speed_right)
+        if total < 1e-6: return INTERVAL
+        return min(INTERVAL, NUMPIXELS / 2. * DISTANCE_PIXEL / total / 2. / 10.)
 
     def speed_update(self, speed_left:float, speed_right:float):
-        self.interval                =  NUMPIXELS / 2. * DISTANCE_PIXEL / (abs(speed_left)+abs(speed_right)) / 2. / 10.
-        if self.interval >  INTERVAL: self.interval = INTERVAL
+        # only keep the newest speeds, the animation applies them once per frame
+        self.speed_left              =  speed_left
+        self.speed_right             =  speed_right
+        self._speed_pending          =  True
+
+    def _speed_apply(self):
+        self._speed_pending          =  False
+        speed_left                   =  self.speed_left
+        speed_right                  =  self.speed_right
+        self.interval                =  self._compute_interval(speed_left, speed_right)
+        self.interval_ns             =  int(self.interval * 1e9)
         self.blob_location_left_inc  =  speed_left  * self.interval / DISTANCE_PIXEL
         self.blob_location_right_inc = -speed_right * self.interval / DISTANCE_PIXEL
-        self.color_left              =  colorwheel(int(abs(speed_left)/MAXSPEED*255))
-        self.color_right             =  colorwheel(int(abs(speed_right)/MAXSPEED*255))
-
-    async def speed_start(self, stop_event: asyncio.Event, speed_left:  float=5.0, speed_right: float=-15.0):
+        self.forward_left            =  speed_left  > 0
+        self.forward_right           =  speed_right > 0
+        self.color_left              =  COLORWHEEL_LUT[min(int(abs(speed_left) *_SPEED2IDX), 255)]
+        self.color_right             =  COLORWHEEL_LUT[min(int(abs(speed_right)*_SPEED2IDX), 255)]
+        # blob pixels only change with speed, scale them here instead of every frame
+        self.blob_left_colors        =  blob_colors(self.color_left,  self.forward_left)
+        self.blob_right_colors       =  blob_colors(self.color_right, self.forward_right)
+
+    def speed_start(self, speed_left:  float=5.0, speed_right: float=-15.0):
         self.blob_location_left      =  START_LEFT
         self.blob_location_right     =  END_RIGHT
-        self.interval                =  NUMPIXELS /2. * DISTANCE_PIXEL / (abs(speed_left)+abs(speed_right)) / 2.  / 10.
-        if self.interval > INTERVAL: self.interval = INTERVAL
-        self.blob_location_left_inc  =  speed_left  * self.interval / DISTANCE_PIXEL
-        self.blob_location_right_inc = -speed_right * self.interval / DISTANCE_PIXEL
+        self.speed_update(speed_left=speed_left, speed_right=speed_right)
+        self._buf[:]                 =  BLK
+        self._lit_left               =  self._left_windows[0][0, :0]     # pixels lit in previous frame
+        self._lit_right              =  self._right_windows[0][0, :0]
+        self._start(neoShow.SPEED)
+
+    def _speed_frame(self):
         LEFT_LENGTH                  =  END_LEFT  - START_LEFT  +1
         RIGHT_LENGTH                 =  END_RIGHT - START_RIGHT +1
-        self.color_left              =  colorwheel(int(abs(speed_left )/MAXSPEED*255))
-        self.color_right             =  colorwheel(int(abs(speed_right)/MAXSPEED*255))
-
-        while not stop_event.is_set():
-            startTime = time.perf_counter()
-            self.pixels.fill(BLK)                                            # clear pixel buffer
-            self.blob_location_left  += self.blob_location_left_inc          # light loc left
-            self.blob_location_right += self.blob_location_right_inc         # light loc right
-            bl = int(self.blob_location_left  % LEFT_LENGTH)  + START_LEFT   # make sure we stay in range
-            br = int(self.blob_location_right % RIGHT_LENGTH) + START_RIGHT  # make sure we stay in range
-
-            # create light blob on left side
-            if speed_left > 0:
-                inten_inc = 1./(BLOBWIDTH)
-                inten = 0.0
-                for pixel in range(bl-BLOBWIDTH+1,bl+1):
-                    if (pixel < START_LEFT): pixel = END_LEFT - (START_LEFT - pixel) +1
-                    ic = inten**3
-                    self.pixels[pixel] = ( int(self.color_left[0]*ic),
-                                            int(self.color_left[1]*ic),
-                                            int(self.color_left[2]*ic),
-                                            int(self.color_left[3]*ic) )
-                    inten += inten_inc
-            else:
-                inten = 1.0
-                inten_inc =  -1./(BLOBWIDTH)
-                for pixel in range(bl,bl+BLOBWIDTH):
-                    if (pixel > END_LEFT):  pixel = START_LEFT + (pixel - END_LEFT) -1
-                    ic = inten**3
-                    self.pixels[pixel] = ( int(self.color_left[0]*ic),
-                                            int(self.color_left[1]*ic),
-                                            int(self.color_left[2]*ic),
-                                            int(self.color_left[3]*ic) )
-                    inten += inten_inc
-
-            # create light block or right side, runs backwards
-            if speed_right > 0:
-                inten_inc = 1./(BLOBWIDTH)
-                inten = 0.0
-                for pixel in range(br-BLOBWIDTH+1,br+1):
-                    if (pixel < START_RIGHT): pixel = END_RIGHT - (START_RIGHT - pixel) +1
-                    ic = inten**3
-                    self.pixels[pixel] = ( int(self.color_right[0]*ic),
-                                            int(self.color_right[1]*ic),
-                                            int(self.color_right[2]*ic),
-                                            int(self.color_right[3]*ic) )
-                    inten += inten_inc
-            else:
-                inten = 1.0
-                inten_inc =  -1./(BLOBWIDTH)
-                for pixel in range(br,br+BLOBWIDTH):
-                    if (pixel > END_RIGHT):  pixel = START_RIGHT + (pixel - END_RIGHT) -1
-                    ic = inten**3
-                    self.pixels[pixel] = ( int(self.color_right[0]*ic),
-                                            int(self.color_right[1]*ic),
-                                            int(self.color_right[2]*ic),
-                                            int(self.color_right[3]*ic) )
-                    inten += inten_inc
-
-            self.pixels.show()
-
-            sleepTime = self.interval - (time.perf_counter() - startTime)
-            await asyncio.sleep(max(0.,sleepTime))
-
-        self.clear()
+        if self._speed_pending: self._speed_apply()                          # speed changed since last frame
+        buf = self._buf
+        buf[self._lit_left]  = BLK                                           # clear previous blobs only
+        buf[self._lit_right] = BLK
+        self.blob_location_left  += self.blob_location_left_inc              # light loc left
+        self.blob_location_right += self.blob_location_right_inc             # light loc right
+        bl = int(self.blob_location_left  % LEFT_LENGTH)                     # blob head on the ring
+        br = int(self.blob_location_right % RIGHT_LENGTH)                    # blob head on the ring
+
+        # create light blob on left side
+        left_forward, left_backward = self._left_windows
+        self._lit_left = left_forward[bl] if self.forward_left else left_backward[bl]
+        buf[self._lit_left] = self.blob_left_colors
+
+        # create light block or right side, runs backwards
+        right_forward, right_backward = self._right_windows
+        self._lit_right = right_forward[br] if self.forward_right else right_backward[br]
+        buf[self._lit_right] = self.blob_right_colors
+
+        self._flush()
+        return self.interval_ns
 
 #########################################################################################################
 # ZMQ Data Receiver for Neo Pixels
 #########################################################################################################
 
+# Topic and replies of the light control messages
+TOPIC_LIGHT   = b"light"
+REPLY_OK      = b"OK"
+REPLY_UNKNOWN = b"UNKNOWN"
+REPLY_ERROR   = b"ERROR"
+
 class zmqWorkerNeo:
 
     def __init__(self, logger, zmqPort: int = 5554):
 
-        self.dataReady =  asyncio.Event()
+        # received neoData, None is queued when the worker finishes
+        self.queue     =  asyncio.Queue()
         self.finished  =  asyncio.Event()
-        self.dataReady.clear()
         self.finished.clear()
 
         self.logger     = logger
-        self.finish_up  = False
-        self.paused     = False
         self.zmqPort    = zmqPort
 
-        self.new_neo    = False
-        self.timeout    = False
-
-        self.data_neo = neoData()
-
         self.logger.log(logging.INFO, 'Neopixel zmqWorker initialized')
 
     async def start(self, stop_event: asyncio.Event):
 
-        self.new_neo = False
-
         context = zmq.asyncio.Context()
-        socket = context.socket(zmq.REP)
-        socket.bind("tcp://*:{}".format(self.zmqPort))
-
-        poller = zmq.asyncio.Poller()
-        poller.register(socket, zmq.POLLIN)
+        socket = self._bind(context)
 
         self.logger.log(logging.INFO, 'Neopixel zmqWorker started on {}'.format(self.zmqPort))
 
-        while not stop_event.is_set():
-            try:
-                events = dict(await poller.poll(timeout=-1))
-                if socket in events and events[socket] == zmq.POLLIN:
+        try:
+            while not stop_event.is_set():
+                try:
                     response = await socket.recv_multipart()
                     if len(response) == 2:
                         [topic, msg_packed] = response
-                        if topic == b"light":
-                            msg_dict = msgpack.unpackb(msg_packed)
-                            self.data_neo = dict2obj(msg_dict)
-                            self.new_neo = True
-                            socket.send_string("OK")
+                        if topic == TOPIC_LIGHT:
+                            try:
+                                data_neo = neoData.unpack(msg_packed)
+                            except (TypeError, ValueError, msgpack.UnpackException):
+                                self.logger.log(
+                                    logging.ERROR, 'Neopixels zmqWorker malformed light data')
+                                await socket.send(REPLY_ERROR)
+                            else:
+                                self.queue.put_nowait(data_neo)
+                                await socket.send(REPLY_OK)
                         else:
-                            socket.send_string("UNKNOWN")
+                            await socket.send(REPLY_UNKNOWN)
                     else:
                         self.logger.log(
                             logging.ERROR, 'Neopixels zmqWorker malformed message')
-                        socket.send_string("ERROR")
-
-                if (self.new_neo):
-                    self.dataReady.set()
-                    self.new_neo  = False
-
-            except:
-                self.logger.log(logging.ERROR, 'Neopixels zmqWorker error')
-                poller.unregister(socket)
-                socket.close()
-                socket = context.socket(zmq.REP)
-                socket.bind("tcp://*:{}".format(self.zmqPort))
-                poller.register(socket, zmq.POLLIN)
-                self.new_neo = False
-
-            await asyncio.sleep(0)
-
-        self.logger.log(logging.DEBUG, 'Neopixels zmqWorker finished')
-        socket.close()
-        context.term()
-        self.finished.set()
+                        await socket.send(REPLY_ERROR)
+
+                except zmq.ZMQError as e:
+                    if e.errno == zmq.ETERM: break # context terminated
+                    self.logger.exception('Neopixels zmqWorker error')
+                    if e.errno == zmq.EFSM:
+                        # REP socket is out of its receive/send sequence, only a new socket recovers
+                        socket.close()
+                        socket = self._bind(context)
+
+        finally:
+            self.logger.log(logging.DEBUG, 'Neopixels zmqWorker finished')
+            socket.close()
+            context.term()
+            self.queue.put_nowait(None)
+            self.finished.set()
+
+    def _bind(self, context):
+        socket = context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)    # closing does not wait for unsent replies
+        socket.setsockopt(zmq.IMMEDIATE, 1) # queue only on completed connections
+        socket.bind("tcp://*:{}".format(self.zmqPort))
+        return socket
 
     def set_zmqPort(self, port):
         self.zmqPort = port
@@ -404,18 +547,12 @@ async def handle_termination(neo, logger, stop_events, tasks):
 
 async def main(args: argparse.Namespace):
 
-    speed_stop_event  = asyncio.Event()
-    speed_stop_event.clear()
-
-    rainbow_stop_event = asyncio.Event()
-    rainbow_stop_event.clear()
-
-    hum_stop_event = asyncio.Event()
-    hum_stop_event.clear()
+    animation_stop_event = asyncio.Event()
+    animation_stop_event.clear()
 
     zmq_stop_event = asyncio.Event()
 
-    stop_events  = [speed_stop_event,  rainbow_stop_event,  hum_stop_event,  zmq_stop_event]
+    stop_events  = [animation_stop_event, zmq_stop_event]
 
     # Setup logging
     logger = logging.getLogger(__name__)
@@ -430,12 +567,10 @@ async def main(args: argparse.Namespace):
     # Create all the async tasks
     # They will run until stop signal is created
     zmq_task     = asyncio.create_task(zmq.start(stop_event=zmq_stop_event))
+    animate_task = asyncio.create_task(neo.animate(stop_event=animation_stop_event))
+    writer_task  = asyncio.create_task(neo.writer())
 
-    tasks = [zmq_task] # frequently updated tasks
-
-    speed_task = None
-    rainbow_task = None
-    hum_task = None
+    tasks = [zmq_task, animate_task, writer_task] # frequently updated tasks
 
     # Set up a Control-C handler to gracefully stop the program
     # This mechanism is only available in Unix
@@ -445,92 +580,94 @@ async def main(args: argparse.Namespace):
         loop.add_signal_handler(signal.SIGINT,  lambda: asyncio.create_task(handle_termination(neo=neo, logger=logger, tasks=tasks, stop_events=stop_events)) ) # control-c
         loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(handle_termination(neo=neo, logger=logger, tasks=tasks, stop_events=stop_events)) ) # kill
 
-    # Main Loop for ZMQ messages,
-    # Set lights according to ZMQ message we received
+    # Handlers for the ZMQ messages
+    # Animations are rendered by the animate task, static displays end the running animation
 
-    while not zmq.finished.is_set():
+    def handle_rainbow(data_neo):
+        neo.rainbow_start()
 
-        await zmq.dataReady.wait()
-        zmq.dataReady.clear()
+    def handle_brightness(data_neo):
+        if data_neo.intensity <= 1.0 and data_neo.intensity >= 0.:
+            neo.set_brightness(data_neo.intensity)
+        else:
+            logger.log(logging.ERROR, 'Neopixel intensity out of range...')
 
-        # Rainbow
-        if zmq.data_neo.show == neoshow["rainbow"]:
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                # clear all pixes
-                neo.clear()
-                # start rainbow
-                rainbow_stop_event.clear()
-                rainbow_task = asyncio.create_task(neo.rainbow_start(stop_event=rainbow_stop_event))
-            else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
+    def handle_battery(data_neo):
+        # static battery display
+        neo.battery(level_left=data_neo.battery_left, level_right=data_neo.battery_right)
 
-        elif zmq.data_neo.show == neoshow["rainbow_off"]:
-            rainbow_stop_event.set()
-            rainbow_task = None
+    def handle_speed(data_neo):
+        if neo.mode == neoShow.SPEED:
+            # speed indicator is running, update it
+            if abs(data_neo.speed_left  - neo.speed_left)  >= SPEEDEPS or \
+               abs(data_neo.speed_right - neo.speed_right) >= SPEEDEPS:
+                neo.speed_update(speed_left=data_neo.speed_left, speed_right=data_neo.speed_right)
+        else:
+            neo.speed_start(speed_left=data_neo.speed_left, speed_right=data_neo.speed_right)
 
-        # Brightness
-        elif zmq.data_neo.show == neoshow["brightness"]:
-            if zmq.data_neo.intensity < 1.0 and zmq.data_neo.intensity >= 0.:
-                neo.brightness(zmq.data_neo.intensity)
-            else:
-                logging.log(logging.ERROR, 'Neopixel intensity out of range...')
+    def handle_off(data_neo):
+        neo.clear()
 
-        # Battery
-        elif zmq.data_neo.show == neoshow["battery"]:
-            # set static battery display
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                neo.battery(level_left=zmq.data_neo.battery_left, level_right=zmq.data_neo.battery_right)
-            else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
-
-        # Speed
-        elif zmq.data_neo.show == neoshow["speed"]:
-            # start speed indicator
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                speed_stop_event.clear()
-                speed_task = asyncio.create_task(neo.speed_start(stop_event=speed_stop_event))
-            elif speed_task is not None and rainbow_task == None and hum_task == None:
-                neo.speed_update(speed_left=zmq.data_neo.speed_left, speed_right=zmq.data_neo.speed_right)
-            else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
+    def handle_on(data_neo):
+        neo.white()
 
-        elif zmq.data_neo.show == neoshow["speed_off"]:
-            speed_stop_event.set()
-            speed_task = None
+    def handle_hum(data_neo):
+        neo.hum_start()
 
-        # On / Off
-        elif zmq.data_neo.show == neoshow["off"]:
-            # All lights off
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                neo.clear()
-            else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
+    def handle_stop(data_neo):
+        # exit program
+        for stop_event in stop_events: stop_event.set()
+        # Make sure lights are off
+        neo.clear()
 
-        elif zmq.data_neo.show == neoshow["on"]:
-            # all lights on
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                neo.white()
+    # display handlers, brightness is applied while the queue is drained
+    dispatch = {
+        neoShow.SPEED:      handle_speed,
+        neoShow.BATTERY:    handle_battery,
+        neoShow.RAINBOW:    handle_rainbow,
+        neoShow.STOP:       handle_stop,
+        neoShow.OFF:        handle_off,
+        neoShow.ON:         handle_on,
+        neoShow.HUM:        handle_hum,
+    }
+
+    # Main Loop for ZMQ messages,
+    # Set lights according to ZMQ message we received
+
+    stopped     = zmq_stop_event.is_set
+    queue       = zmq.queue
+    get_handler = dispatch.get
+    while not stopped():
+
+        pending = [await queue.get()]
+        while not queue.empty(): pending.append(queue.get_nowait())
+
+        # when several messages arrived only the newest display is shown,
+        # brightness is state and applied in order, a stop is never dropped
+        data_neo = None
+        for message in pending:
+            if message is None: break # zmq worker finished
+            if message.show == neoShow.BRIGHTNESS:
+                handle_brightness(message)
             else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
+                data_neo = message
+                if message.show == neoShow.STOP: break
 
-        # Humming
-        elif zmq.data_neo.show == neoshow["hum"]:
-            if speed_task == None and rainbow_task == None and hum_task == None:
-                hum_stop_event.clear()
-                hum_task = asyncio.create_task(neo.hum_start(stop_event=hum_stop_event))
+        if data_neo is not None:
+            handler = get_handler(data_neo.show)
+            if handler is not None:
+                handler(data_neo)
             else:
-                logger.log(logging.ERROR, 'Neopixel other animation is running...')
-    
-        elif zmq.data_neo.show == neoshow["hum_off"]:
-            hum_stop_event.set()
-            hum_task = None
-
-        # Exit Program
-        elif zmq.data_neo.show == neoshow["stop"]:
-            # exit program
-            for stop_event in stop_events: stop_event.set()
-            # Make sure lights are off
-            neo.clear()
+                logger.log(logging.ERROR, 'Neopixel unknown show {}'.format(data_neo.show))
+
+        if message is None: break # zmq worker finished
+
+    # The zmq worker waits for the next message and the animate task may be idle, both need to be cancelled
+    zmq_task.cancel()
+    animate_task.cancel()
+    # Make sure lights are off before the writer ends
+    neo.clear()
+    neo.close()
 
     # Wait until all tasks are completed, which is when user wants to terminate the program
     await asyncio.wait(tasks, timeout=float('inf'))
@@ -569,6 +706,9 @@ if __name__ == '__main__':
     )
 
     try:
-        asyncio.run(main(args))
+        if os.name != 'nt':
+            uvloop.run(main(args))
+        else:
+            asyncio.run(main(args))
     except KeyboardInterrupt:
         pass
@@ -7,8 +7,9 @@ import zmq
 import msgpack
 import logging
 import argparse
+from dataclasses import astuple
 
-from neoindicator import neoData, neoshow, obj2dict
+from neoindicator import neoData, neoShow
 
 ##############################################################################################
 # MAIN
@@ -53,8 +54,8 @@ if __name__ == '__main__':
     context = zmq.Context()
     socket = context.socket(zmq.REQ)
     socket.connect(args.zmqport)
-    data_neo  = neoData(show=neoshow["brightness"], intensityt=75./100.)
-    neo_msgpack = msgpack.packb(obj2dict(vars(data_neo)))
+    data_neo  = neoData(show=neoShow.BRIGHTNESS, intensity=75./100.)
+    neo_msgpack = msgpack.packb(astuple(data_neo))
     socket.send_multipart([b"light", neo_msgpack])
 
     response = socket.recv_string()